@@ -1,13 +1,15 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from scipy.optimize import linprog
+from itertools import combinations
 
 # --- 1. CONFIGURATION ---
 st.set_page_config(page_title="NPK Pro Calculator", layout="wide", page_icon="✨")
 
 # --- 2. "PAJAKKU" STYLE CSS (THE MAGIC) ---
-st.markdown("""
+# Literal string (konstanta kode, tanpa biaya build). Tetap di-emit tiap rerun: elemen yang
+# tidak dirender ulang akan dihapus Streamlit dari halaman.
+CSS_HTML = """
     <style>
         @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap');
         
@@ -86,7 +88,7 @@ st.markdown("""
         .stSelectbox > label { font-weight: 600; color: #374151; font-size: 14px; }
         
         /* BUTTON */
-        .stButton>button {
+        .stButton>button, .stFormSubmitButton>button {
             background: linear-gradient(90deg, #4f46e5 0%, #6366f1 100%); /* Indigo Gradient */
             color: white;
             border: none;
@@ -98,7 +100,7 @@ st.markdown("""
             transition: transform 0.1s;
             margin-top: 20px;
         }
-        .stButton>button:hover {
+        .stButton>button:hover, .stFormSubmitButton>button:hover {
             transform: translateY(-2px);
             color: white;
         }
@@ -111,7 +113,9 @@ st.markdown("""
             border: none;
         }
     </style>
-""", unsafe_allow_html=True)
+"""
+
+st.markdown(CSS_HTML, unsafe_allow_html=True)
 
 # --- 3. DATABASE & LOGIC ---
 RAW_MATS = {
@@ -122,32 +126,168 @@ RAW_MATS = {
     "Clay": {"N": 0.0,  "P": 0.0, "K": 0.0, "S": 0.0, "Type": "Filler", "Price": 250}
 }
 
+# Preset target (N, P, K, S) per grade; urutan key = urutan pilihan di selectbox
+GRADE_PRESETS = {
+    "15-15-15": (15, 15, 15, 2),
+    "15-10-12": (15, 10, 12, 2),
+    "16-16-16": (16, 16, 16, 0),
+    "Custom":   (15, 15, 15, 0)
+}
+
 GUARANTEE_REF = {
     "15-15-15": {"Urea": 173.1, "DAP": 343.3, "KCl": 257.5, "ZA": 94.9, "Clay": 161.2},
     "15-10-12": {"Urea": 215.3, "DAP": 228.9, "KCl": 206.0, "ZA": 89.8, "Clay": 290.0},
     "16-16-16": {"Urea": 230.9, "DAP": 366.3, "KCl": 274.7, "ZA": 0.0,  "Clay": 158.2}
 }
 
-def solve_opt(tn, tp, tk, ts, prices):
-    mats = list(RAW_MATS.keys())
-    n_vars = len(mats)
+# Matriks kandungan hara (fraksi, baris N/P/K/S) & baris filler, urutan kolom mengikuti MATS
+MATS = list(RAW_MATS.keys())
+NUTRIENT_MAT = np.array([[RAW_MATS[m][nut] / 100 for m in MATS] for nut in "NPKS"])
+FILLER_ROW = np.array([1.0 if RAW_MATS[m]["Type"] == "Filler" else 0.0 for m in MATS])
+BOUNDS = tuple((0.0, 1000.0) for _ in MATS)  # Batas massa tiap bahan (basis 1 ton)
+
+# Resep Guarantee Figure sebagai vektor massa (kg) per grade, urutan kolom mengikuti MATS
+GUARANTEE_MAT = {g: np.array([rec.get(m, 0.0) for m in MATS]) for g, rec in GUARANTEE_REF.items()}
+
+# LP kecil (5 variabel) diselesaikan dengan enumerasi vertex secara batch di numpy:
+# tiap vertex = kendala massa total + (n_vars - 1) pertidaksamaan aktif, vertex feasible
+# termurah adalah solusi optimal. Matriks sistemnya hanya bergantung pada bentuk LP
+# (ada/tidaknya baris S), jadi inversnya dihitung sekali per bentuk dan di-cache.
+@st.cache_resource
+def vertex_systems(n_nut):
+    n_vars = len(MATS)
+    G = np.vstack([-NUTRIENT_MAT[:n_nut], FILLER_ROW[None, :], -np.eye(n_vars)])  # Termasuk x >= 0
+    
+    combos = np.array(list(combinations(range(len(G)), n_vars - 1)))
+    M = np.empty((len(combos), n_vars, n_vars))
+    M[:, 0] = 1.0
+    M[:, 1:] = G[combos]
+    
+    nonsingular = np.abs(np.linalg.det(M)) > 1e-9
+    return G, combos[nonsingular], np.linalg.inv(M[nonsingular])
+
+# Per panggilan tinggal substitusi ruas kanan; return None bila tidak ada vertex feasible
+def solve_vertices(c, b_ub, n_nut, total_mass):
+    G, combos, M_inv = vertex_systems(n_nut)
+    h = np.concatenate([b_ub, np.zeros(len(c))])
+    
+    rhs = np.empty((len(combos), len(c)))
+    rhs[:, 0] = total_mass
+    rhs[:, 1:] = h[combos]
+    x = np.einsum("kij,kj->ki", M_inv, rhs)
+    x = x[np.all(x @ G.T <= h + 1e-6, axis=1)]
+    if len(x) == 0:
+        return None
+    return x[np.argmin(x @ c)]
+
+# Solver tanpa cache sendiri: satu-satunya pemanggil adalah build_results, yang memegang
+# memoization. Return berupa array/tuple sederhana (bukan OptimizeResult).
+def solve_opt(tn, tp, tk, ts, prices_tuple):
+    n_vars = len(MATS)
     total_mass = 1000.0
-    c = [prices[m] for m in mats]
-    A_ub, b_ub = [], []
+    c = np.ascontiguousarray(prices_tuple, dtype=np.float64)
     
-    A_ub.append([-RAW_MATS[m]["N"]/100 for m in mats]); b_ub.append(-tn/100 * total_mass)
-    A_ub.append([-RAW_MATS[m]["P"]/100 for m in mats]); b_ub.append(-tp/100 * total_mass)
-    A_ub.append([-RAW_MATS[m]["K"]/100 for m in mats]); b_ub.append(-tk/100 * total_mass)
-    if ts > 0:
-        A_ub.append([-RAW_MATS[m]["S"]/100 for m in mats]); b_ub.append(-ts/100 * total_mass)
-        
-    filler_row = [1.0 if RAW_MATS[m]["Type"] == "Filler" else 0.0 for m in mats]
-    if sum(filler_row) > 0: A_ub.append(filler_row); b_ub.append(300.0)
+    # Baris S hanya aktif bila target S > 0; baris filler (batas 300 kg) selalu ikut
+    n_nut = 4 if ts > 0 else 3
+    b_ub = np.append(-np.array([tn, tp, tk, ts][:n_nut]) / 100 * total_mass, 300.0)
+    
+    x = solve_vertices(c, b_ub, n_nut, total_mass)
+    if x is not None:
+        return x, float(c @ x), True, MATS
+
+    # Fallback ke HiGHS (mis. target tidak feasible, supaya status solver tetap dari HiGHS).
+    # Import di sini: scipy berat, jarang dibutuhkan
+    from scipy.optimize import linprog
+    from scipy.sparse import csc_matrix
+
+    A_ub = np.vstack([-NUTRIENT_MAT[:n_nut], FILLER_ROW[None, :]])
+    A_eq, b_eq = csc_matrix(np.ones((1, n_vars))), np.array([total_mass])
+    res = linprog(c, A_ub=csc_matrix(A_ub), b_ub=b_ub, A_eq=A_eq, b_eq=b_eq, bounds=BOUNDS, method='highs-ds',
+                  options={'presolve': True, 'disp': False})
+    return res.x, res.fun, res.success, MATS
+
+# Seluruh hasil (resep, total biaya, penghematan) di-cache per kombinasi input,
+# jadi hitung ulang dengan input yang sama hanya berupa lookup cache.
+# Ini satu-satunya lapisan cache untuk solve (kunci mencakup argumen solve_opt + grade).
+@st.cache_data(show_spinner=False, max_entries=64)
+def build_results(tn, tp, tk, ts, grade, prices_tuple):
+    price_vec = np.asarray(prices_tuple)  # Sejajar dengan urutan MATS
+    masses, _, success, mat_list = solve_opt(tn, tp, tk, ts, prices_tuple)
+    if not success:
+        return pd.DataFrame(), 0, 0
+    
+    # Hitung di numpy, DataFrame dibuat sekali (sudah terfilter & terurut) hanya untuk tampilan
+    cost = masses * price_vec
+    mask = masses > 0.01
+    order = np.argsort(-masses[mask], kind="stable")
+    total_cost = float(cost[mask].sum())
+    
+    df = pd.DataFrame({
+        "Material": np.array(mat_list)[mask][order],
+        "Mass": masses[mask][order],
+        "Price": price_vec[mask][order],
+        "Cost": cost[mask][order],
+    })
+    
+    # Baseline
+    base_cost = float(GUARANTEE_MAT[grade] @ price_vec) if grade in GUARANTEE_MAT else 0
+    
+    # Jika base_cost 0 (misal Custom grade), set saving 0
+    if base_cost > 0:
+        savings = base_cost - total_cost
+    else:
+        savings = 0
+    
+    return df, total_cost, savings
+
+# HTML bar komposisi di-cache per resep, jadi rerun tanpa perubahan hasil tidak membangun ulang string HTML
+@st.cache_data(show_spinner=False, max_entries=64)
+def build_composition_html(rows):
+    bars = []
+    for material, mass in rows:
+        width = (mass / 1000) * 100
+        # FIX: Menggunakan kutip satu untuk pembungkus HTML agar aman
+        bars.append(f"""
+            <div style="margin-bottom:12px;">
+                <div style="display:flex; justify-content:space-between; font-size:13px; color:#e2e8f0; margin-bottom:4px; font-weight:500;">
+                    <span>{material}</span>
+                    <span>{mass:.1f} kg</span>
+                </div>
+                <div style="background:#334155; height:6px; border-radius:10px; width:100%;">
+                    <div style="background:#6366f1; width:{width}%; height:100%; border-radius:10px;"></div>
+                </div>
+            </div>
+        """.strip())
+    # Digabung tanpa baris kosong agar tetap terbaca sebagai satu blok HTML oleh markdown
+    return "\n".join(bars)
+
+# Konfigurasi kolom tabel resep (statis), urutan kolom sama dengan DataFrame dari build_results
+RECIPE_COLUMN_CONFIG = {
+    "Material": st.column_config.TextColumn("Bahan Baku"),
+    "Mass": st.column_config.NumberColumn("Massa (kg)", format="%.2f"),
+    "Price": st.column_config.NumberColumn("Harga Satuan", format="Rp %.0f"),
+    "Cost": st.column_config.NumberColumn("Total Biaya", format="Rp %.0f"),
+}
+
+# Template kartu hasil (str.format), dirakit sekali di level modul
+COST_LABEL_HTML = '<div class="result-label">ESTIMASI BIAYA PRODUKSI (COGS)</div>'
+COST_VALUE_HTML = '<div class="result-value-big">Rp {total_cost:,.0f}</div>'
+COST_SUB_HTML = '<div class="result-sub">Total Biaya Bahan Baku per Ton Produk</div>'
+
+# Template kartu penghematan, diindeks dengan is_profit: False -> Merah, True -> Hijau
+SAVINGS_STYLE = (("#f87171", ""), ("#4ade80", "+"))
+SAVINGS_CARD = """
+    <div class="mini-box">
+        <div class="result-label" style="color: #94a3b8;">POTENSI PENGHEMATAN VS DESAIN</div>
+        <div style="font-size: 24px; font-weight: 700; color: {color}; letter-spacing: -0.5px;">
+            {sign} Rp {savings:,.0f}
+        </div>
+        <div style="font-size: 12px; color: #64748b; margin-top:5px;">*Dibandingkan dengan Guarantee Figure</div>
+    </div>
+    """
 
-    A_eq, b_eq = [[1.0] * n_vars], [total_mass]
-    bounds = [(0, total_mass) for _ in range(n_vars)]
-    res = linprog(c, A_ub=A_ub, b_ub=b_ub, A_eq=A_eq, b_eq=b_eq, bounds=bounds, method='highs')
-    return res, mats
+# Header biaya + kartu penghematan digabung jadi satu blok HTML (tanpa baris kosong di tengah)
+RESULT_CARD_HTML = COST_LABEL_HTML + COST_VALUE_HTML + COST_SUB_HTML + SAVINGS_CARD
 
 # --- 4. UI LAYOUT (SPLIT CARD) ---
 
@@ -162,35 +302,30 @@ with col_input:
     st.markdown('<div class="input-container">', unsafe_allow_html=True)
     
     st.markdown("### 1. Target Grade Specification")
-    grade_sel = st.selectbox("Pilih Formula Standar", ["15-15-15", "15-10-12", "16-16-16", "Custom"], label_visibility="collapsed")
+    grade_sel = st.selectbox("Pilih Formula Standar", list(GRADE_PRESETS), label_visibility="collapsed")
     
     # Presets
-    if grade_sel == "15-15-15": d = (15,15,15,2)
-    elif grade_sel == "15-10-12": d = (15,10,12,2)
-    elif grade_sel == "16-16-16": d = (16,16,16,0)
-    else: d = (15,15,15,0)
-    
-    c1, c2, c3, c4 = st.columns(4)
-    tn = c1.number_input("N %", value=float(d[0]))
-    tp = c2.number_input("P %", value=float(d[1]))
-    tk = c3.number_input("K %", value=float(d[2]))
-    ts = c4.number_input("S %", value=float(d[3]))
+    d = GRADE_PRESETS[grade_sel]
     
-    st.markdown("### 2. Market Prices (IDR / Kg)")
-    curr_prices = {}
-    
-    # Input Harga yang rapi (Grid)
-    cp1, cp2 = st.columns(2)
-    with cp1:
-        for i, (m, p) in enumerate(RAW_MATS.items()):
-            if i % 2 == 0: # Ganjil
-                curr_prices[m] = st.number_input(f"{m}", value=p["Price"], step=100)
-    with cp2:
+    # Target & harga dibungkus satu form: perubahan input tidak memicu rerun sampai tombol ditekan.
+    # Pilihan grade tetap di luar form agar preset target langsung ter-update.
+    with st.form("controls", border=False):
+        c1, c2, c3, c4 = st.columns(4)
+        tn = c1.number_input("N %", value=float(d[0]))
+        tp = c2.number_input("P %", value=float(d[1]))
+        tk = c3.number_input("K %", value=float(d[2]))
+        ts = c4.number_input("S %", value=float(d[3]))
+        
+        st.markdown("### 2. Market Prices (IDR / Kg)")
+        
+        # Input Harga yang rapi (Grid) - nilai disimpan Streamlit di session_state lewat key.
+        # Harga dikumpulkan per indeks sebagai int Python (tanpa batas int32), sejajar dengan MATS
+        curr_prices = [0] * len(MATS)
+        price_cols = st.columns(2)
         for i, (m, p) in enumerate(RAW_MATS.items()):
-            if i % 2 != 0: # Genap
-                curr_prices[m] = st.number_input(f"{m}", value=p["Price"], step=100)
-    
-    run_btn = st.button("HITUNG ESTIMASI BIAYA")
+            curr_prices[i] = price_cols[i % 2].number_input(f"{m}", value=p["Price"], step=100, key=f"price_{m}")
+        
+        run_btn = st.form_submit_button("HITUNG ESTIMASI BIAYA", type="primary")
     
     st.markdown('</div>', unsafe_allow_html=True)
 
@@ -204,72 +339,25 @@ with col_output:
     df_show = pd.DataFrame()
     
     if run_btn:
-        res, mat_list = solve_opt(tn, tp, tk, ts, curr_prices)
-        if res.success:
-            masses = res.x
-            df = pd.DataFrame({"Material": mat_list, "Mass": masses})
-            df["Price"] = df["Material"].apply(lambda x: curr_prices[x])
-            df["Cost"] = df["Mass"] * df["Price"]
-            df = df[df["Mass"] > 0.01].sort_values("Mass", ascending=False)
-            
-            total_cost = df["Cost"].sum()
-            
-            # Baseline
-            guar_recipe = GUARANTEE_REF.get(grade_sel, {})
-            base_cost = sum([qty * curr_prices.get(m, 0) for m, qty in guar_recipe.items()])
-            
-            # Jika base_cost 0 (misal Custom grade), set saving 0
-            if base_cost > 0:
-                savings = base_cost - total_cost
-            else:
-                savings = 0
-                
-            is_profit = savings >= 0
-            df_show = df.copy()
+        prices_tuple = tuple(curr_prices)
+        df_show, total_cost, savings = build_results(tn, tp, tk, ts, grade_sel, prices_tuple)
+        is_profit = bool(savings >= 0)
 
     # RENDER DARK CARD
     st.markdown('<div class="output-container">', unsafe_allow_html=True)
     
-    # HEADER RESULT
-    st.markdown('<div class="result-label">ESTIMASI BIAYA PRODUKSI (COGS)</div>', unsafe_allow_html=True)
-    
+    # HEADER RESULT + MINI BOX: PROFIT, dikirim sebagai satu elemen markdown
     # Format angka rupiah dengan pemisah ribuan koma
-    st.markdown(f'<div class="result-value-big">Rp {total_cost:,.0f}</div>', unsafe_allow_html=True)
-    st.markdown('<div class="result-sub">Total Biaya Bahan Baku per Ton Produk</div>', unsafe_allow_html=True)
-    
-    # MINI BOX: PROFIT
-    color_txt = "#4ade80" if is_profit else "#f87171" # Green vs Red
-    sign = "+" if is_profit else ""
-    
-    st.markdown(f"""
-    <div class="mini-box">
-        <div class="result-label" style="color: #94a3b8;">POTENSI PENGHEMATAN VS DESAIN</div>
-        <div style="font-size: 24px; font-weight: 700; color: {color_txt}; letter-spacing: -0.5px;">
-            {sign} Rp {savings:,.0f}
-        </div>
-        <div style="font-size: 12px; color: #64748b; margin-top:5px;">*Dibandingkan dengan Guarantee Figure</div>
-    </div>
-    """, unsafe_allow_html=True)
+    color_txt, sign = SAVINGS_STYLE[is_profit]
+    st.markdown(RESULT_CARD_HTML.format(total_cost=total_cost, color=color_txt, sign=sign, savings=savings),
+                unsafe_allow_html=True)
     
     # COMPOSITION PREVIEW
     if not df_show.empty:
         st.markdown('<br><div class="result-label" style="margin-bottom:15px;">KOMPOSISI UTAMA</div>', unsafe_allow_html=True)
         # Simple manual chart using HTML bars for cleaner look in dark mode
-        # FIX: Menggunakan kutip satu untuk pembungkus HTML agar aman
-        for _, row in df_show.head(4).iterrows():
-            width = (row['Mass'] / 1000) * 100
-            # Menggunakan f-string dengan kutip satu di luar
-            st.markdown(f"""
-            <div style="margin-bottom:12px;">
-                <div style="display:flex; justify-content:space-between; font-size:13px; color:#e2e8f0; margin-bottom:4px; font-weight:500;">
-                    <span>{row['Material']}</span>
-                    <span>{row['Mass']:.1f} kg</span>
-                </div>
-                <div style="background:#334155; height:6px; border-radius:10px; width:100%;">
-                    <div style="background:#6366f1; width:{width}%; height:100%; border-radius:10px;"></div>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+        top_rows = tuple(df_show[["Material", "Mass"]].head(4).itertuples(index=False, name=None))
+        st.markdown(build_composition_html(top_rows), unsafe_allow_html=True)
             
     st.markdown('</div>', unsafe_allow_html=True) # End Output Container
 
@@ -278,12 +366,7 @@ if not df_show.empty:
     st.markdown("<br>", unsafe_allow_html=True)
     with st.expander("Lihat Rincian Tabel Resep", expanded=False):
         st.dataframe(
-            df_show[["Material", "Mass", "Price", "Cost"]],
-            column_config={
-                "Material": st.column_config.TextColumn("Bahan Baku"),
-                "Mass": st.column_config.NumberColumn("Massa (kg)", format="%.2f"),
-                "Price": st.column_config.NumberColumn("Harga Satuan", format="Rp %.0f"),
-                "Cost": st.column_config.NumberColumn("Total Biaya", format="Rp %.0f"),
-            },
+            df_show,
+            column_config=RECIPE_COLUMN_CONFIG,
             use_container_width=True
         )